@@ -8,6 +8,8 @@ import subprocess
 #   in order to avoid using serial control characters (which would mess things up).
 
 SYNC_BYTES = b'serial sync\n'
+# The line that represents a byte on the serial port, for each possible byte.
+BYTE_AS_HEX_LINE = tuple(f'{i:02x}\n'.encode('ascii') for i in range(256))
 
 def parse_cmd_args():
     parser = argparse.ArgumentParser(
@@ -34,16 +36,12 @@ def get_bytes_to_write_file_to_serial(file_path):
 
     checksum = get_16_bit_checksum(file_contents)
 
-    file_contents_as_hex = file_contents.hex()
-    assert(len(file_contents_as_hex) == file_size * 2)
+    file_contents_as_hex_for_serial = b''.join(
+        map(BYTE_AS_HEX_LINE.__getitem__, file_contents))
+    assert(len(file_contents_as_hex_for_serial) == file_size * 3)
     
-    file_contents_as_hex_for_serial = ''
-    for i in range(0, len(file_contents_as_hex), 2):
-        file_contents_as_hex_for_serial += f'{file_contents_as_hex[i:i+2]}\n'
-    
-    return (f'{file_size}\n'
-            f'{checksum}\n'
-            f'{file_contents_as_hex_for_serial}'.encode('ascii'))
+    return (f'{file_size}\n{checksum}\n'.encode('ascii') +
+            file_contents_as_hex_for_serial)
 
 if __name__ == '__main__':
     args = parse_cmd_args()
@@ -8,9 +8,18 @@ import argparse
 import tempfile
 import fcntl
 import stat
+import threading
+import ctypes
+import errno
 
 F_SETPIPE_SZ = 1031  # Linux 2.6.35+
 F_GETPIPE_SZ = 1032  # Linux 2.6.35+
+SPLICE_F_MOVE = 1  # Linux 2.6.17+
+SPLICE_F_MORE = 4  # Linux 2.6.17+
+SPLICE_MAX_CHUNK_SIZE = 1 << 20
+# How long to wait for qemu to close the trace FIFO after the expect script
+# exits (on which qemu should receive SIGHUP and terminate).
+SPLICING_THREAD_JOIN_TIMEOUT_IN_SECONDS = 30
 
 EXECUTABLE1_FOR_SERIAL_NAME = 'executable1'
 EXECUTABLE2_FOR_SERIAL_NAME = 'executable2'
@@ -29,6 +38,12 @@ WRITE_EXECUTABLES_TO_SERIAL_REL_PATH = os.path.join(
     COMMUNICATIONS_DIR_NAME, WRITE_EXECUTABLES_TO_SERIAL_NAME)
 BASH_SCRIPT_FIRST_LINE = '#!/bin/bash'
 
+VERBOSE = False
+
+
+def debug_print(*args, **kwargs):
+    if VERBOSE:
+        print(*args, file=sys.stderr, **kwargs)
 
 def write_text_file(file_path, contents):
     with open(file_path, 'w') as f:
@@ -39,18 +54,40 @@ def execute_cmd_in_dir(cmd, dir_path='.', stdout_dest=subprocess.DEVNULL):
     return subprocess.run(cmd, check=True, cwd=dir_path,
                           stdout=stdout_dest)
 
+# Maps a path to its os.stat result, or to None in case os.stat failed.
+stat_results_cache = {}
+
+def get_cached_stat_result(path):
+    if path not in stat_results_cache:
+        try:
+            stat_results_cache[path] = os.stat(path)
+        except OSError:
+            stat_results_cache[path] = None
+    return stat_results_cache[path]
+
+def does_path_have_file_type(path, is_file_type_func):
+    stat_result = get_cached_stat_result(path)
+    return stat_result is not None and is_file_type_func(stat_result.st_mode)
+
 def verify_arg_is_file(arg, arg_name):
-    if not os.path.isfile(arg):
+    if not does_path_have_file_type(arg, stat.S_ISREG):
         raise RuntimeError(f'{arg_name} must be a file path, but {arg} isn\'t.')
 
 def verify_arg_is_fifo(arg, arg_name):
-    if stat.S_ISFIFO(os.stat(arg).st_mode) == 0:
+    if not does_path_have_file_type(arg, stat.S_ISFIFO):
         raise RuntimeError(f'{arg_name} must be a fifo path, but {arg} isn\'t.')
 
 def verify_arg_is_dir(arg, arg_name):
-    if not os.path.isdir(arg):
+    if not does_path_have_file_type(arg, stat.S_ISDIR):
         raise RuntimeError(f'{arg_name} must be a dir path, but {arg} isn\'t.')
 
+def verify_arg_is_file_or_fifo_if_it_exists(arg, arg_name):
+    if get_cached_stat_result(arg) is not None and not (
+            does_path_have_file_type(arg, stat.S_ISREG) or
+            does_path_have_file_type(arg, stat.S_ISFIFO)):
+        raise RuntimeError(f'{arg_name} must be a file or fifo path, but '
+                           f'{arg} isn\'t.')
+
 def verify_arg_is_in_range(arg, arg_name, low, high):
     if not (low <= arg <= high):
         raise RuntimeError(f'{arg_name} must be in range [{low}, {high}], but '
@@ -225,6 +262,16 @@ def parse_cmd_args():
              'in which the FIFO\'s buffer getting full is bad, and '
              'so it is recommended to use a FIFO whose buffer is '
              'of size `cat /proc/sys/fs/pipe-max-size`.')
+    analysis_or_fifo.add_argument(
+        '--splice_sink_path', type=str,
+        help='Path of a file (or a FIFO) into which trace records will be '
+             'written. memory_tracer.py moves the trace records from its '
+             'internal trace FIFO to the sink by using splice(2), so the '
+             'trace records never pass through a user space buffer. '
+             'This is useful when you only wish to store the trace records '
+             'and analyze them later (or pipe them to a tool that doesn\'t '
+             'need the workload info). If the sink is a FIFO, another process '
+             'must open it for reading, or memory_tracer.py would block.')
     analysis_or_fifo.add_argument(
         '--dont_trace', action='store_true',
         help='If specified, memory_tracer.py will run without '
@@ -371,6 +418,12 @@ def parse_cmd_args():
         if args.trace_fifo_path:
             args.trace_fifo_path = os.path.realpath(args.trace_fifo_path)
             verify_arg_is_fifo(args.trace_fifo_path, 'trace_fifo_path')
+        if args.splice_sink_path:
+            args.splice_sink_path = os.path.realpath(args.splice_sink_path)
+            verify_arg_is_dir(os.path.split(args.splice_sink_path)[0],
+                              'the dir of splice_sink_path')
+            verify_arg_is_file_or_fifo_if_it_exists(args.splice_sink_path,
+                                                    'splice_sink_path')
 
         verify_arg_is_in_range(args.log_of_GMBE_block_len,
                                'log_of_GMBE_block_len', 0, 64)
@@ -461,36 +514,101 @@ def get_executables_paths(workload_path_on_guest, workload_path_on_host,
     return executable1_path, executable2_path    
 
 
-def get_trace_fifo_path(trace_fifo_path_cmd_arg):
+def get_fifo_max_size():
+    with open('/proc/sys/fs/pipe-max-size') as f:
+        return int(f.read())
+
+def get_trace_fifo_path_and_fd(trace_fifo_path_cmd_arg):
     if trace_fifo_path_cmd_arg:
-        return trace_fifo_path_cmd_arg
+        return trace_fifo_path_cmd_arg, None
 
     trace_fifo_path = os.path.join(temp_dir_path, 'trace_fifo')
     os.mkfifo(trace_fifo_path)
-    print_fifo_max_size_cmd = ('cat', '/proc/sys/fs/pipe-max-size')
-    fifo_max_size_as_str = execute_cmd_in_dir(
-        print_fifo_max_size_cmd,
-        stdout_dest=subprocess.PIPE).stdout.strip().decode()
-    fifo_max_size = int(fifo_max_size_as_str)
+    fifo_max_size = get_fifo_max_size()
     
     debug_print(f'change {trace_fifo_path} to size {fifo_max_size} '
                 f'(/proc/sys/fs/pipe-max-size)')
-    fifo_fd = os.open(trace_fifo_path, os.O_NONBLOCK)
+    # The caller should keep fifo_fd open until qemu is done with the FIFO.
+    # Otherwise, the FIFO's buffer might be freed, and then the next open of
+    # the FIFO would allocate a buffer of the default size.
+    fifo_fd = os.open(trace_fifo_path, os.O_RDONLY | os.O_NONBLOCK)
     fcntl.fcntl(fifo_fd, F_SETPIPE_SZ, fifo_max_size)
     assert(fcntl.fcntl(fifo_fd, F_GETPIPE_SZ) == fifo_max_size)
-    os.close(fifo_fd)
 
-    return trace_fifo_path
+    return trace_fifo_path, fifo_fd
+
+def get_libc_splice():
+    # os.splice exists only since Python 3.10, so call splice(2) directly.
+    libc_splice = ctypes.CDLL(None, use_errno=True).splice
+    libc_splice.restype = ctypes.c_ssize_t
+    libc_splice.argtypes = (ctypes.c_int, ctypes.c_void_p,
+                            ctypes.c_int, ctypes.c_void_p,
+                            ctypes.c_size_t, ctypes.c_uint)
+    return libc_splice
+
+def splice_fifo_to_sink(fifo_fd, sink_fd):
+    libc_splice = get_libc_splice()
+    while True:
+        num_of_spliced_bytes = libc_splice(fifo_fd, None, sink_fd, None,
+                                           SPLICE_MAX_CHUNK_SIZE,
+                                           SPLICE_F_MOVE | SPLICE_F_MORE)
+        if num_of_spliced_bytes == 0:
+            return
+        if num_of_spliced_bytes < 0:
+            splice_errno = ctypes.get_errno()
+            if splice_errno == errno.EINTR:
+                continue
+            raise OSError(splice_errno,
+                          f'splice failed: {os.strerror(splice_errno)}')
+
+def start_splicing_trace_fifo_to_sink(trace_fifo_path, fifo_fd,
+                                      splice_sink_path):
+    # The splicing thread stores here the exception that stopped it (if any),
+    # so that stop_splicing_trace_fifo_to_sink could re-raise it.
+    splicing_exceptions = []
+    def splice_fifo_to_sink_and_store_exception(fifo_fd, sink_fd):
+        try:
+            splice_fifo_to_sink(fifo_fd, sink_fd)
+        except BaseException as e:
+            splicing_exceptions.append(e)
+
+    debug_print(f'start splicing {trace_fifo_path} to {splice_sink_path}')
+    # Hold a write end of the FIFO ourselves, so that splice wouldn't see EOF
+    # before qemu opens the FIFO for writing.
+    fifo_keeper_fd = os.open(trace_fifo_path, os.O_WRONLY | os.O_NONBLOCK)
+    os.set_blocking(fifo_fd, True)
+    sink_fd = os.open(splice_sink_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                      0o644)
+    splicing_thread = threading.Thread(
+        target=splice_fifo_to_sink_and_store_exception,
+        args=(fifo_fd, sink_fd), daemon=True)
+    splicing_thread.start()
+    return splicing_thread, splicing_exceptions, fifo_keeper_fd, sink_fd
+
+def stop_splicing_trace_fifo_to_sink(splicing_thread, splicing_exceptions,
+                                     fifo_keeper_fd, sink_fd):
+    # Once qemu closes the FIFO too, splice would return 0, and the splicing
+    # thread would finish.
+    os.close(fifo_keeper_fd)
+    splicing_thread.join(SPLICING_THREAD_JOIN_TIMEOUT_IN_SECONDS)
+    if splicing_thread.is_alive():
+        # Don't close sink_fd, as the splicing thread might still use it.
+        raise RuntimeError(f'the trace FIFO was still open for writing '
+                           f'{SPLICING_THREAD_JOIN_TIMEOUT_IN_SECONDS} seconds '
+                           f'after qemu should have terminated, so the '
+                           f'splice_sink_path might be truncated. Is qemu '
+                           f'still running?')
+    os.close(sink_fd)
+    if splicing_exceptions:
+        raise RuntimeError('splicing trace records to splice_sink_path '
+                           'failed, so the sink is probably '
+                           'truncated.') from splicing_exceptions[0]
+    debug_print('done splicing')
 
 if __name__ == '__main__':
     args = parse_cmd_args()
 
-    if args.verbose:
-        def debug_print(*args, **kwargs):
-            print(*args, file=sys.stderr, **kwargs)
-    else:
-        def debug_print(*args, **kwargs):
-            return
+    VERBOSE = args.verbose
 
     this_script_path = os.path.realpath(__file__)
     this_script_location = os.path.split(this_script_path)[0]
@@ -504,10 +622,10 @@ if __name__ == '__main__':
             args.dont_add_communications_with_host_to_workload,
             temp_dir_path)
         if not args.dont_use_qemu:
-            trace_fifo_path = get_trace_fifo_path(args.trace_fifo_path)
+            trace_fifo_path, trace_fifo_fd = get_trace_fifo_path_and_fd(
+                args.trace_fifo_path)
             write_executables_to_serial_path = os.path.join(
                 this_script_location, WRITE_EXECUTABLES_TO_SERIAL_REL_PATH)
-            qemu_with_GMBEOO_path = os.path.realpath(args.qemu_with_GMBEOO_path)
             run_qemu_and_workload_expect_script_path = os.path.join(
                 this_script_location, RUN_QEMU_AND_WORKLOAD_EXPECT_SCRIPT_REL_PATH)
 
@@ -523,7 +641,7 @@ if __name__ == '__main__':
                 str(args.log_of_GMBE_tracing_ratio),
                 args.analysis_tool_path,
                 trace_fifo_path,
-                qemu_with_GMBEOO_path,
+                args.qemu_with_GMBEOO_path,
                 str(args.verbose),
                 str(args.dont_exit_qemu_when_done),
                 str(args.print_trace_info),
@@ -533,8 +651,19 @@ if __name__ == '__main__':
                 str(args.guest_RAM_in_MBs),
                 ]
 
-            execute_cmd_in_dir(run_qemu_and_workload_cmd,
-                               temp_dir_path, sys.stdout)
+            try:
+                if args.splice_sink_path:
+                    splicing_state = start_splicing_trace_fifo_to_sink(
+                        trace_fifo_path, trace_fifo_fd, args.splice_sink_path)
+                try:
+                    execute_cmd_in_dir(run_qemu_and_workload_cmd,
+                                       temp_dir_path, sys.stdout)
+                finally:
+                    if args.splice_sink_path:
+                        stop_splicing_trace_fifo_to_sink(*splicing_state)
+            finally:
+                if trace_fifo_fd is not None:
+                    os.close(trace_fifo_fd)
 
         else:
             assert(args.dont_use_qemu)
@@ -5,6 +5,7 @@ import subprocess
 import os
 import os.path
 import argparse
+import threading
 import tests
 
 SIMPLE_ANALYSIS_SOURCE_NAME = 'simple_analysis.c'
@@ -13,34 +14,51 @@ TEST_SCRIPT_PREFIX = 'test_'
 TEST_SCRIPT_EXT = '.py'
 LOADABLE_KERNEL_MODULE_SUFFIX = '_lkm'
 
-# Note that this script removes this directory upon starting.
+# Note that this script replaces this directory upon starting.
 OUTPUT_DIR_NAME = 'tests_bin'
+STAGING_DIR_SUFFIX = '.new'
+OLD_DIR_SUFFIX = '.old'
 
 def execute_cmd_in_dir(cmd, dir_path):
     if args.verbosity_level > 0:
         print(f'executing cmd (in {dir_path}): {cmd}')
     subprocess.run(cmd, check=True, cwd=dir_path)
 
-def does_dir_contain_c_files(dir_path):
-    return subprocess.run(f'ls {dir_path}/*.c {dir_path}/*.C',
-                          shell=True, check=False, capture_output=True).stdout != b''
+def is_c_file(file_fullname):
+    return os.path.splitext(file_fullname)[1].lower() == '.c'
 
 def compile_c_files(dir_path):
     for root_dir_path, dir_names, file_fullnames in os.walk(dir_path):
         if not root_dir_path.endswith(LOADABLE_KERNEL_MODULE_SUFFIX) and (
-                does_dir_contain_c_files(root_dir_path)):
+                any(map(is_c_file, file_fullnames))):
             output_dir_path = os.path.join(root_dir_path, OUTPUT_DIR_NAME)
-            shutil.rmtree(output_dir_path, ignore_errors=True)
-            os.mkdir(output_dir_path)
+            staging_dir_path = output_dir_path + STAGING_DIR_SUFFIX
+            old_output_dir_path = output_dir_path + OLD_DIR_SUFFIX
+            # Leftovers of a previous run that didn't finish.
+            shutil.rmtree(staging_dir_path, ignore_errors=True)
+            shutil.rmtree(old_output_dir_path, ignore_errors=True)
+            os.mkdir(staging_dir_path)
 
             for fullname in file_fullnames:
-                name, ext = os.path.splitext(fullname)
-                if ext.lower() == '.c':
-                    bin_rel_path = os.path.join(OUTPUT_DIR_NAME, name)
+                if is_c_file(fullname):
+                    name = os.path.splitext(fullname)[0]
+                    bin_rel_path = os.path.join(
+                        OUTPUT_DIR_NAME + STAGING_DIR_SUFFIX, name)
                     compile_cmd = ['gcc', '-Werror', '-Wall', '-pedantic',
                                    fullname, '-o', bin_rel_path]
                     execute_cmd_in_dir(compile_cmd, root_dir_path)
 
+            # Swap the new output dir in with renames, so that the output dir
+            # is replaced only if everything compiled, and remove the previous
+            # one while the tests are running.
+            try:
+                os.rename(output_dir_path, old_output_dir_path)
+            except FileNotFoundError:
+                pass
+            os.rename(staging_dir_path, output_dir_path)
+            threading.Thread(target=shutil.rmtree, args=(old_output_dir_path,),
+                             kwargs={'ignore_errors': True}).start()
+
 parser = argparse.ArgumentParser(
     formatter_class=argparse.RawDescriptionHelpFormatter,
     description='Build and run tests for memory_tracer.\n'
@@ -10,12 +10,12 @@ import sys
 import fcntl
 import signal
 import stat
+import importlib.util
+import filecmp
 
 F_SETPIPE_SZ = 1031  # Linux 2.6.35+
 F_GETPIPE_SZ = 1032  # Linux 2.6.35+
 
-SIGKILL = 9
-
 NUM_OF_MILLISECONDS_IN_SECOND = 1000
 
 # constants from common_memory_intensive.h and long_memory_intensive.h
@@ -25,6 +25,11 @@ BIG_NUM_OF_ITERS_OVER_OUR_ARR = 500
 
 NUM_OF_ACCESSES_FOR_INC = 2
 
+NUM_OF_BYTES_TO_SPLICE = 50 * (1 << 20)
+
+# sizeof(GMBEOO_TraceRecord) in simple_analysis.c
+GMBEOO_TRACE_RECORD_SIZE = 16
+
 VERBOSITY_LEVEL = 0
 
 TOY_WORKLOAD_AND_ANALYSIS_TOOLS_DIR_REL_PATH = 'toy_workloads_and_analysis_tools'
@@ -510,12 +515,10 @@ def test_trace_fifo_path_cmd_arg(this_script_location,
                                                 'simple_analysis')
         simple_analysis_output_path = os.path.join(temp_dir_path,
                                                    'analysis_output')
-        start_simple_analylsis_cmd = (
-            f'{simple_analysis_path} {trace_fifo_path} > '
-            f'{simple_analysis_output_path} & echo $!')
-        simple_analysis_pid = int(
-            subprocess.run(start_simple_analylsis_cmd, shell=True, check=True,
-                           stdout=subprocess.PIPE).stdout.strip().decode())
+        with open(simple_analysis_output_path, 'w') as simple_analysis_output:
+            simple_analysis = subprocess.Popen(
+                [simple_analysis_path, trace_fifo_path],
+                stdout=simple_analysis_output)
         
         # The purpose of the (somewhat ugly) try-except-finally is to make sure
         # that the analysis tool doesn't stay alive after the test.
@@ -533,7 +536,7 @@ def test_trace_fifo_path_cmd_arg(this_script_location,
                  '--dont_add_communications_with_host_to_workload',
                  '--workload_path_on_host', workload_path])
 
-            os.kill(simple_analysis_pid, signal.SIGUSR1)
+            simple_analysis.send_signal(signal.SIGUSR1)
             analysis_output = read_file_until_it_contains_str(
                 simple_analysis_output_path, '-----end analysis output-----')
             
@@ -547,10 +550,87 @@ def test_trace_fifo_path_cmd_arg(this_script_location,
         except:
             raise
         finally:
+            simple_analysis.kill()
+            simple_analysis.wait()
+
+def import_memory_tracer(memory_tracer_script_path):
+    spec = importlib.util.spec_from_file_location('memory_tracer',
+                                                  memory_tracer_script_path)
+    memory_tracer = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(memory_tracer)
+    return memory_tracer
+
+def test_splicing_trace_fifo_to_sink(this_script_location,
+                                     memory_tracer_script_path,
+                                     qemu_with_GMBEOO_path, guest_image_path,
+                                     snapshot_name):
+    # This test doesn't use qemu. It checks the splicing helpers of
+    # memory_tracer.py against a writer process.
+    memory_tracer = import_memory_tracer(memory_tracer_script_path)
+
+    with tempfile.TemporaryDirectory() as temp_dir_path:
+        memory_tracer.temp_dir_path = temp_dir_path
+        trace_fifo_path, trace_fifo_fd = (
+            memory_tracer.get_trace_fifo_path_and_fd(None))
+        try:
+            source_path = os.path.join(temp_dir_path, 'source.bin')
+            with open(source_path, 'wb') as f:
+                f.write(os.urandom(NUM_OF_BYTES_TO_SPLICE))
+
+            splice_sink_path = os.path.join(temp_dir_path, 'sink.bin')
+            splicing_state = memory_tracer.start_splicing_trace_fifo_to_sink(
+                trace_fifo_path, trace_fifo_fd, splice_sink_path)
+            execute_cmd_in_dir(['dd', f'if={source_path}',
+                                f'of={trace_fifo_path}', 'bs=1M'],
+                               stderr_dest=subprocess.DEVNULL)
+            memory_tracer.stop_splicing_trace_fifo_to_sink(*splicing_state)
+            assert(filecmp.cmp(source_path, splice_sink_path, shallow=False))
+
+            # A writer that doesn't close the FIFO must make stopping fail
+            # (rather than hang).
+            memory_tracer.SPLICING_THREAD_JOIN_TIMEOUT_IN_SECONDS = 1
+            splicing_state = memory_tracer.start_splicing_trace_fifo_to_sink(
+                trace_fifo_path, trace_fifo_fd, splice_sink_path)
+            with open(trace_fifo_path, 'wb') as fifo_writer_stdout:
+                fifo_writer = subprocess.Popen(['sleep', '60'],
+                                               stdout=fifo_writer_stdout)
             try:
-                os.kill(simple_analysis_pid, SIGKILL)
-            except ProcessLookupError:
-                pass
+                memory_tracer.stop_splicing_trace_fifo_to_sink(*splicing_state)
+            except RuntimeError as e:
+                assert('Is qemu still running?' in str(e))
+            else:
+                assert(False)
+            finally:
+                fifo_writer.kill()
+                fifo_writer.wait()
+        finally:
+            os.close(trace_fifo_fd)
+
+def test_splice_sink_path_cmd_arg(this_script_location,
+                                  memory_tracer_script_path,
+                                  qemu_with_GMBEOO_path, guest_image_path,
+                                  snapshot_name):
+    workload_path = get_toy_elf_path(this_script_location,
+                                     'simple_user_memory_intensive_workload')
+
+    with tempfile.TemporaryDirectory() as temp_dir_path:
+        splice_sink_path = os.path.join(temp_dir_path, 'trace_records.bin')
+        mem_tracer_output = get_mem_tracer_error_and_output(
+            this_script_location,
+            memory_tracer_script_path,
+            qemu_with_GMBEOO_path,
+            guest_image_path,
+            snapshot_name,
+            ['--splice_sink_path', splice_sink_path,
+             '--print_trace_info',
+             '--dont_add_communications_with_host_to_workload',
+             '--workload_path_on_host', workload_path])
+
+        num_of_events_written_to_trace_buf = int(re.search(
+            r'num_of_events_written_to_trace_buf: (\d+)',
+            mem_tracer_output).group(1))
+        assert(os.stat(splice_sink_path).st_size ==
+               num_of_events_written_to_trace_buf * GMBEOO_TRACE_RECORD_SIZE)
 
 def test_invalid_combination_of_trace_fifo_and_analysis_tool_cmd_args(
         this_script_location, memory_tracer_script_path,
@@ -596,6 +676,8 @@ def test_invalid_file_or_dir_cmd_arg(
     must_be_a_file_expected_err_message = ('must be a file path, but')
     must_be_a_fifo_expected_err_message = ('must be a fifo path, but')
     must_be_a_dir_expected_err_message = ('must be a dir path, but')
+    must_be_a_file_or_fifo_expected_err_message = (
+        'must be a file or fifo path, but')
     try:
         get_mem_tracer_error_and_output(
             this_script_location,
@@ -657,6 +739,21 @@ def test_invalid_file_or_dir_cmd_arg(
     else:
         assert(False)
 
+    try:
+        get_mem_tracer_error_and_output(
+            this_script_location,
+            memory_tracer_script_path,
+            qemu_with_GMBEOO_path,
+            guest_image_path,
+            snapshot_name,
+            ['--splice_sink_path', '/home',
+             '--dont_add_communications_with_host_to_workload',
+             '--workload_path_on_host', workload_path])
+    except subprocess.CalledProcessError as e:
+        assert(must_be_a_file_or_fifo_expected_err_message in e.stderr.decode())
+    else:
+        assert(False)
+
     try:
         get_mem_tracer_error_and_output(
             this_script_location,